@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import numpy as np
+import os
+import tempfile
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -34,60 +37,203 @@ PROCEDURE_COLORS = {
     'Valve or Valve/CABG': SECONDARY_ACCENT,
 }
 
+# Above this many points the hospital scatter shows a stratified sample per comparison category
+SCATTER_POINT_LIMIT = 5000
+
+# Above this many hospitals the sidebar asks for a search term before listing matches
+HOSPITAL_SELECT_LIMIT = 200
+
 # --- Data Loading and Preprocessing ---
+DATA_FILE = 'cardiac_data_cleaned_engineered.csv'
+
+# Only the columns the dashboard reads, typed at parse time. Counts, rates and IDs all fit
+# comfortably in 32 bits, which halves memory for every groupby.
+CSV_COLUMNS = {
+    'Facility_ID': 'int32',
+    'Hospital_Name': 'category',
+    'Region': 'category',
+    'Procedure': 'category',
+    'Year_of_Hospital_Discharge': 'string',
+    'Number_of_Cases': 'int32',
+    'Number_of_Deaths': 'int32',
+    'Observed_Mortality_Rate': 'float32',
+    'Expected_Mortality_Rate': 'float32',
+    'Risk_Adjusted_Mortality_Rate': 'float32',
+    'Lower_Limit_of_Confidence_Interval': 'float32',
+    'Upper_Limit_of_Confidence_Interval': 'float32',
+    'Comparison_Results': 'category',
+}
+
+def _preprocess_csv(file_path):
+    df = pd.read_csv(file_path, usecols=list(CSV_COLUMNS), dtype=CSV_COLUMNS)
+
+    years = df['Year_of_Hospital_Discharge'].str.strip().str.extract(r'^(\d+)(?:-(\d+))?$')
+    df['Start_Year'] = pd.to_numeric(years[0], errors='coerce').astype('Int64')
+    df['End_Year'] = pd.to_numeric(years[1], errors='coerce').fillna(df['Start_Year']).astype('Int64')
+    df['Mid_Year'] = ((df['Start_Year'] + df['End_Year']) // 2).astype('Int64')
+
+    df['Comparison_Results_Category'] = df['Comparison_Results']
+
+    return df
+
+def _ensure_parquet(csv_path):
+    # Columnar cache next to the CSV, rebuilt when the CSV or this script is newer
+    parquet_path = os.path.splitext(csv_path)[0] + '.cache.parquet'
+    source_mtime = max(os.path.getmtime(csv_path), os.path.getmtime(__file__))
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= source_mtime:
+        return pd.read_parquet(parquet_path, engine="pyarrow")
+
+    df = _preprocess_csv(csv_path)
+    # Write to a temp file and swap it in, so an interrupted write never leaves a truncated cache behind
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.parquet.tmp', dir=os.path.dirname(os.path.abspath(parquet_path)))
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, parquet_path)
+    except OSError:
+        # Read-only deployments: serve the freshly parsed frame without caching it
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
+
 @st.cache_data
 def load_and_preprocess_data(file_path):
     try:
-        df = pd.read_csv(file_path)
+        return _ensure_parquet(file_path)
     except FileNotFoundError:
         st.error(f"Error: '{file_path}' not found. Please upload the file or ensure the path is correct.")
         st.stop()
 
-    df.columns = df.columns.str.strip().str.replace(' ', '_').str.replace('/', '_').str.replace('-', '_')
+@st.cache_resource
+def get_dataset():
+    # Shared, unhashed handle on the loaded frame so cached aggregations can be keyed on filters alone
+    return load_and_preprocess_data(DATA_FILE)
+
+# --- Filtering ---
+def year_mask(df, years):
+    return (df['Start_Year'] >= years[0]) & (df['Start_Year'] <= years[1])
+
+def category_mask(series, value):
+    # Compare the small integer codes instead of the category strings
+    return series.cat.codes == series.cat.categories.get_loc(value)
+
+@st.cache_resource
+def get_filter_options():
+    # Year -> Region -> Procedure -> hospitals, built once so the sidebar never rescans rows
+    df = get_dataset()
+    # Rows whose discharge year could not be parsed have no year to be listed under
+    combos = df[['Start_Year', 'Region', 'Procedure', 'Hospital_Name']].dropna(subset=['Start_Year']).drop_duplicates()
+    options = {}
+    for year, region, procedure, hospital in combos.itertuples(index=False):
+        options.setdefault(int(year), {}).setdefault(region, {}).setdefault(procedure, set()).add(hospital)
+    return options
+
+def available_options(options, years, *selected):
+    levels = [options[year] for year in range(years[0], years[1] + 1) if year in options]
+    for value in selected:
+        if value == 'Overall':
+            levels = [child for level in levels for child in level.values()]
+        else:
+            levels = [level[value] for level in levels if value in level]
+    return sorted(set().union(*levels))
+
+def filter_mask(df, years, region, procedure, hospital):
+    mask = year_mask(df, years)
+    for col, value in (('Region', region), ('Procedure', procedure), ('Hospital_Name', hospital)):
+        if value != 'Overall':
+            mask &= category_mask(df[col], value)
+    return mask
+
+def with_derived_columns(df_filtered):
+    # Derived metrics are computed on the filtered rows only rather than stored for the whole dataset
+    return df_filtered.assign(
+        Observed_vs_Expected_Difference=df_filtered['Observed_Mortality_Rate'] - df_filtered['Expected_Mortality_Rate'],
+        CI_Width=df_filtered['Upper_Limit_of_Confidence_Interval'] - df_filtered['Lower_Limit_of_Confidence_Interval']
+    )
 
-    numeric_cols = [
-        'Facility_ID', 'Number_of_Cases', 'Number_of_Deaths',
-        'Observed_Mortality_Rate', 'Expected_Mortality_Rate', 'Risk_Adjusted_Mortality_Rate',
-        'Lower_Limit_of_Confidence_Interval', 'Upper_Limit_of_Confidence_Interval'
+# --- Aggregations ---
+# Bounded so every filter combination a session explores does not stay in server memory forever
+@st.cache_data(max_entries=64)
+def compute_aggregates(years, region, procedure, hospital):
+    df = get_dataset()
+    df_filtered = with_derived_columns(df.loc[filter_mask(df, years, region, procedure, hospital)])
+    if df_filtered.empty:
+        return None
+
+    # KPI reductions run directly on the contiguous numpy buffers, accumulating in 64 bits
+    total_procedures = int(df_filtered['Number_of_Cases'].to_numpy().sum(dtype=np.int64))
+    avg_observed_mortality = np.nanmean(df_filtered['Observed_Mortality_Rate'].to_numpy(), dtype=np.float64)
+    avg_diff = np.nanmean(df_filtered['Observed_vs_Expected_Difference'].to_numpy(), dtype=np.float64)
+
+    hospital_points = df_filtered[
+        ['Number_of_Cases', 'Observed_Mortality_Rate', 'Hospital_Name', 'Comparison_Results_Category']
     ]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    def parse_year_range(year_str):
-        if pd.isna(year_str):
-            return None, None
-        year_str = str(year_str).strip()
-        if '-' in year_str:
-            parts = year_str.split('-')
-            try:
-                start = int(parts[0])
-                end = int(parts[1])
-                return start, end
-            except ValueError:
-                return None, None
-        else:
-            try:
-                single_year = int(year_str)
-                return single_year, single_year
-            except ValueError:
-                return None, None
 
-    df[['Start_Year', 'End_Year']] = df['Year_of_Hospital_Discharge'].apply(lambda x: pd.Series(parse_year_range(x)))
-    df['Mid_Year'] = ((df['Start_Year'] + df['End_Year']) / 2).astype('Int64')
+    volume_trend = df_filtered.groupby(['Start_Year', 'Procedure'], observed=True)['Number_of_Cases'].sum().reset_index()
 
-    df['Comparison_Results_Category'] = df['Comparison_Results'].astype('category')
-    df['Is_Higher_Than_Expected_Mortality'] = (df['Comparison_Results'] == 'Rate higher than Statewide Rate')
-    df['Is_Lower_Than_Expected_Mortality'] = (df['Comparison_Results'] == 'Rate lower than Statewide Rate')
-    df['Is_As_Expected_Mortality'] = (df['Comparison_Results'] == 'Rate not different than Statewide Rate')
+    # One pass over Start_Year feeds the mortality trend, the difference trend and the YoY KPI
+    by_year = df_filtered.groupby('Start_Year', observed=True).agg(
+        Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
+        Expected_Mortality_Rate=('Expected_Mortality_Rate', 'mean'),
+        Risk_Adjusted_Mortality_Rate=('Risk_Adjusted_Mortality_Rate', 'mean'),
+        Observed_vs_Expected_Difference=('Observed_vs_Expected_Difference', 'mean')
+    )
 
-    df['Observed_vs_Expected_Difference'] = df['Observed_Mortality_Rate'] - df['Expected_Mortality_Rate']
-    df['Observed_vs_RiskAdjusted_Difference'] = df['Observed_Mortality_Rate'] - df['Risk_Adjusted_Mortality_Rate']
-    df['CI_Width'] = df['Upper_Limit_of_Confidence_Interval'] - df['Lower_Limit_of_Confidence_Interval']
+    mortality_trend = by_year[
+        ['Observed_Mortality_Rate', 'Expected_Mortality_Rate', 'Risk_Adjusted_Mortality_Rate']
+    ].reset_index()
 
-    return df
+    diff_trend = by_year[['Observed_vs_Expected_Difference']].reset_index()
+
+    proc_volume = df_filtered.groupby('Procedure', observed=True)['Number_of_Cases'].sum().reset_index()
+
+    proc_mortality = df_filtered.groupby('Procedure', observed=True).agg(
+        Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
+        Expected_Mortality_Rate=('Expected_Mortality_Rate', 'mean')
+    ).reset_index()
+
+    region_diff = df_filtered.groupby('Region', observed=True)['Observed_vs_Expected_Difference'].mean().reset_index()
+
+    region_comp = df_filtered.groupby(['Region', 'Comparison_Results_Category'], observed=True).size().reset_index(name='Count')
+    region_totals = region_comp.groupby('Region', observed=True)['Count'].transform('sum')
+    region_comp['Percentage'] = region_comp['Count'] / region_totals
+
+    hospital_diff = df_filtered.groupby('Hospital_Name', observed=True)['Observed_vs_Expected_Difference'].mean().reset_index()
+
+    ci_proc = df_filtered.groupby('Procedure', observed=True).agg(
+        Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
+        Lower_Limit_of_Confidence_Interval=('Lower_Limit_of_Confidence_Interval', 'mean'),
+        Upper_Limit_of_Confidence_Interval=('Upper_Limit_of_Confidence_Interval', 'mean')
+    ).reset_index()
+    ci_proc['error_lower'] = ci_proc['Observed_Mortality_Rate'] - ci_proc['Lower_Limit_of_Confidence_Interval']
+    ci_proc['error_upper'] = ci_proc['Upper_Limit_of_Confidence_Interval'] - ci_proc['Observed_Mortality_Rate']
+
+    ci_width_hospital = df_filtered.groupby('Hospital_Name', observed=True).agg(
+        Avg_CI_Width=('CI_Width', 'mean'),
+        Total_Cases=('Number_of_Cases', 'sum')
+    ).reset_index()
+
+    return {
+        "total_procedures": total_procedures,
+        "avg_observed_mortality": avg_observed_mortality,
+        "avg_diff": avg_diff,
+        "hospital_points": hospital_points,
+        "by_year": by_year,
+        "volume_trend": volume_trend,
+        "mortality_trend": mortality_trend,
+        "diff_trend": diff_trend,
+        "proc_volume": proc_volume,
+        "proc_mortality": proc_mortality,
+        "region_diff": region_diff,
+        "region_comp": region_comp,
+        "hospital_diff": hospital_diff,
+        "ci_proc": ci_proc,
+        "ci_width_hospital": ci_width_hospital,
+    }
 
 # Load data
-df = load_and_preprocess_data('cardiac_data_cleaned_engineered.csv')
+filter_options = get_filter_options()
 
 # --- Dashboard Title and Description ---
 st.title("❤️ Cardiac Care Performance Dashboard")
@@ -103,7 +249,7 @@ st.sidebar.header("Dashboard Filters")
 
 # Year Filter
 with st.sidebar.expander("Filter by Year", expanded=True):
-    all_years = sorted(df['Start_Year'].unique())
+    all_years = sorted(filter_options)
     selected_years = st.slider(
         "Select Year Range",
         min_value=min(all_years),
@@ -111,52 +257,57 @@ with st.sidebar.expander("Filter by Year", expanded=True):
         value=(min(all_years), max(all_years)),
         key="year_slider"
     )
-df_filtered_by_year = df[(df['Start_Year'] >= selected_years[0]) & (df['Start_Year'] <= selected_years[1])]
 
 
 # Region Filter
 with st.sidebar.expander("Filter by Region", expanded=True):
-    current_regions_options = ['Overall'] + sorted(df_filtered_by_year['Region'].unique().tolist())
+    current_regions_options = ['Overall'] + available_options(filter_options, selected_years)
     selected_region = st.selectbox(
         "Select a Region",
         options=current_regions_options,
         key="region_select"
     )
-if selected_region == 'Overall':
-    df_filtered_by_region = df_filtered_by_year
-else:
-    df_filtered_by_region = df_filtered_by_year[df_filtered_by_year['Region'] == selected_region]
 
 
 # Procedure Filter
 with st.sidebar.expander("Filter by Procedure", expanded=True):
-    current_procedures_options = ['Overall'] + sorted(df_filtered_by_region['Procedure'].unique().tolist())
+    current_procedures_options = ['Overall'] + available_options(filter_options, selected_years, selected_region)
     selected_procedure = st.selectbox(
         "Select a Procedure",
         options=current_procedures_options,
         key="procedure_select"
     )
-if selected_procedure == 'Overall':
-    df_filtered_by_procedure = df_filtered_by_region
-else:
-    df_filtered_by_procedure = df_filtered_by_region[df_filtered_by_region['Procedure'] == selected_procedure]
 
 
 # Hospital Filter (Optional, for detailed drill-down)
 with st.sidebar.expander("Filter by Hospital", expanded=False):
-    current_hospitals_options = ['Overall'] + sorted(df_filtered_by_procedure['Hospital_Name'].unique().tolist())
+    hospital_names = available_options(filter_options, selected_years, selected_region, selected_procedure)
+    # Long hospital lists are narrowed by a search box instead of rendering every name in the dropdown
+    if len(hospital_names) > HOSPITAL_SELECT_LIMIT:
+        hospital_query = st.text_input(
+            f"Search {len(hospital_names):,} hospitals",
+            key="hospital_search"
+        ).strip().lower()
+        matches = [name for name in hospital_names if hospital_query and hospital_query in name.lower()]
+        if len(matches) > HOSPITAL_SELECT_LIMIT:
+            st.caption(f"Showing {HOSPITAL_SELECT_LIMIT:,} of {len(matches):,} matches; refine the search to see more.")
+            matches = matches[:HOSPITAL_SELECT_LIMIT]
+        # Keep the current selection listed so editing the search does not silently reset the filter
+        current_hospital = st.session_state.get("hospital_select", 'Overall')
+        if current_hospital != 'Overall' and current_hospital in hospital_names and current_hospital not in matches:
+            matches = [current_hospital] + matches
+        hospital_names = matches
+    current_hospitals_options = ['Overall'] + hospital_names
     selected_hospital = st.selectbox(
         "Select a Hospital",
         options=current_hospitals_options,
         key="hospital_select"
     )
-if selected_hospital == 'Overall':
-    df_filtered = df_filtered_by_procedure
-else:
-    df_filtered = df_filtered_by_procedure[df_filtered_by_procedure['Hospital_Name'] == selected_hospital]
 
+aggs = compute_aggregates(tuple(selected_years), selected_region, selected_procedure, selected_hospital)
 
-if df_filtered.empty:
+
+if aggs is None:
     st.warning("No data available for the selected filters. Please adjust your selections.")
     st.stop()
 
@@ -164,10 +315,11 @@ if df_filtered.empty:
 st.header("Key Performance Indicators")
 col1, col2, col3, col4 = st.columns(4)
 
-# Custom CSS for KPI boxes
+# Custom CSS for KPI boxes. Streamlit drops elements that are not re-emitted on a rerun, so the
+# style block is sent every time; its content never changes, so the frontend diff skips it.
 st.markdown(f"""
 <style>
-div[data-testid="metric-container"] {{
+div[data-testid="stMetric"] {{
     background-color: {NEUTRAL_LIGHT}; /* Light background for boxes */
     border: 1px solid {PRIMARY_COLOR}; /* Border with primary color */
     padding: 10% 10% 10% 10%;
@@ -175,12 +327,13 @@ div[data-testid="metric-container"] {{
     color: {NEUTRAL_DARK};
     box-shadow: 0 4px 8px 0 rgba(0, 0, 0, 0.05);
 }}
-div[data-testid="metric-container"] > label {{
+div[data-testid="stMetricLabel"] p {{
     font-size: 1.1em;
     color: {PRIMARY_COLOR}; /* Primary color for labels */
     font-weight: bold;
 }}
-div[data-testid="metric-container"] > div.stMetricValue {{
+div[data-testid="stMetricValue"] {{
+    color: {NEUTRAL_DARK}; /* The value sets its own theme text color, which is light in the dark theme */
     font-size: 2.2em;
     font-weight: bold;
 }}
@@ -189,303 +342,325 @@ div[data-testid="metric-container"] > div.stMetricValue {{
 
 
 # KPI 1: Total Procedures Performed
-total_procedures = int(df_filtered['Number_of_Cases'].sum())
-col1.markdown(f"<div data-testid='metric-container'><label>Total Procedures Performed</label><div class='stMetricValue'>{total_procedures:,}</div></div>", unsafe_allow_html=True)
+total_procedures = aggs["total_procedures"]
+col1.metric("Total Procedures Performed", f"{total_procedures:,}")
 
 # KPI 2: Average Observed Mortality Rate
-avg_observed_mortality = df_filtered['Observed_Mortality_Rate'].mean()
-col2.markdown(f"<div data-testid='metric-container'><label>Avg. Observed Mortality Rate</label><div class='stMetricValue'>{avg_observed_mortality:.2f}%</div></div>", unsafe_allow_html=True)
+avg_observed_mortality = aggs["avg_observed_mortality"]
+col2.metric("Avg. Observed Mortality Rate", f"{avg_observed_mortality:.2f}%")
 
 # KPI 3: Average Observed vs. Expected Difference
-avg_diff = df_filtered['Observed_vs_Expected_Difference'].mean()
-diff_color = ACCENT_POSITIVE if avg_diff < 0 else (ACCENT_NEGATIVE if avg_diff > 0 else PRIMARY_COLOR)
-col3.markdown(f"<div data-testid='metric-container'><label>Avg. Obs. vs Exp. Difference</label><div class='stMetricValue' style='color:{diff_color};'>{avg_diff:.2f}%</div></div>", unsafe_allow_html=True)
+# Inverse delta coloring: above expected mortality shows red, below shows green
+avg_diff = aggs["avg_diff"]
+diff_delta = f"{avg_diff:+.2f}%" if avg_diff != 0 else None
+col3.metric("Avg. Obs. vs Exp. Difference", f"{avg_diff:.2f}%", delta=diff_delta, delta_color="inverse")
 
 # KPI 4: YoY Change in Observed Mortality Rate
+# Two scalar lookups on the cached, year-sorted aggregate; no extra groupby or sort
 yoy_mortality_change = 0.0
-latest_year_data = df_filtered.groupby('Start_Year')['Observed_Mortality_Rate'].mean().sort_index()
-if len(latest_year_data) >= 2:
-    current_year_mortality = latest_year_data.iloc[-1]
-    previous_year_mortality = latest_year_data.iloc[-2]
-    if previous_year_mortality != 0:
-        yoy_mortality_change = ((current_year_mortality - previous_year_mortality) / previous_year_mortality) * 100
-    else:
-        yoy_mortality_change = 0.0
-
-arrow = ""
-yoy_color = NEUTRAL_DARK
-if yoy_mortality_change > 0:
-    arrow = "▲"
-    yoy_color = ACCENT_NEGATIVE
-elif yoy_mortality_change < 0:
-    arrow = "▼"
-    yoy_color = ACCENT_POSITIVE
-
-col4.markdown(f"<div data-testid='metric-container'><label>YoY Avg. Mortality Change</label><div class='stMetricValue' style='color:{yoy_color};'>{yoy_mortality_change:.2f}% {arrow}</div></div>", unsafe_allow_html=True)
+yoy_delta = None
+yearly_mortality = aggs["by_year"]['Observed_Mortality_Rate'].to_numpy()
+if len(yearly_mortality) >= 2:
+    previous_year_mortality, current_year_mortality = yearly_mortality[-2], yearly_mortality[-1]
+    if previous_year_mortality:
+        yoy_mortality_change = (current_year_mortality - previous_year_mortality) / previous_year_mortality * 100
+    if yoy_mortality_change != 0:
+        yoy_delta = f"{current_year_mortality - previous_year_mortality:+.2f} pts"
+
+col4.metric("YoY Avg. Mortality Change", f"{yoy_mortality_change:.2f}%", delta=yoy_delta, delta_color="inverse")
 
 st.markdown("---")
 
 # --- Visualization Sections ---
+# Each section is a fragment fed from the cached aggregates, so it can rerun on its own
 
 # --- Analysis Area 1: Overall Trends Over Time ---
-st.header("Overall Trends Over Time")
-
-col_trend1, col_trend2 = st.columns(2)
-
-with col_trend1:
-    st.subheader("Procedure Volume Trend")
-    df_volume_trend = df_filtered.groupby(['Start_Year', 'Procedure'])['Number_of_Cases'].sum().reset_index()
-    fig_volume_trend = px.line(
-        df_volume_trend,
-        x='Start_Year',
-        y='Number_of_Cases',
-        color='Procedure',
-        title='Total Procedures Performed by Year and Type',
-        labels={'Number_of_Cases': 'Total Cases', 'Start_Year': 'Year'},
+@st.fragment
+def overall_trends_section(aggs):
+    st.header("Overall Trends Over Time")
+
+    st.subheader("Procedure Volume & Mortality Rate Trends")
+    df_volume_trend = aggs["volume_trend"]
+    df_mortality_trend = aggs["mortality_trend"]
+
+    # Both trends share one figure so Plotly lays out and initializes a single plot
+    fig_trends = make_subplots(
+        rows=1, cols=2,
+        subplot_titles=('Total Procedures Performed by Year and Type', 'Average Mortality Rates Over Time')
+    )
+    fallback_colors = px.colors.qualitative.Plotly
+    for i, (procedure, df_procedure) in enumerate(df_volume_trend.groupby('Procedure', observed=True)):
+        fig_trends.add_trace(go.Scatter(
+            x=df_procedure['Start_Year'].to_numpy(), y=df_procedure['Number_of_Cases'].to_numpy(),
+            mode='lines', name=procedure, legendgroup='volume', legendgrouptitle_text='Procedure',
+            line=dict(color=PROCEDURE_COLORS.get(procedure, fallback_colors[i % len(fallback_colors)]))
+        ), row=1, col=1)
+
+    fig_trends.add_trace(go.Scatter(
+        x=df_mortality_trend['Start_Year'].to_numpy(), y=df_mortality_trend['Observed_Mortality_Rate'].to_numpy(),
+        mode='lines+markers', name='Observed Mortality', legendgroup='mortality', legendgrouptitle_text='Mortality',
+        line=dict(color=PRIMARY_COLOR)
+    ), row=1, col=2)
+    fig_trends.add_trace(go.Scatter(
+        x=df_mortality_trend['Start_Year'].to_numpy(), y=df_mortality_trend['Expected_Mortality_Rate'].to_numpy(),
+        mode='lines+markers', name='Expected Mortality', legendgroup='mortality',
+        line=dict(color=NEUTRAL_DARK, dash='dash')
+    ), row=1, col=2)
+    fig_trends.add_trace(go.Scatter(
+        x=df_mortality_trend['Start_Year'].to_numpy(), y=df_mortality_trend['Risk_Adjusted_Mortality_Rate'].to_numpy(),
+        mode='lines+markers', name='Risk-Adjusted Mortality', legendgroup='mortality',
+        line=dict(color=SECONDARY_ACCENT, dash='dot')
+    ), row=1, col=2)
+
+    fig_trends.update_xaxes(title_text='Year')
+    fig_trends.update_yaxes(title_text='Total Cases', row=1, col=1)
+    fig_trends.update_yaxes(title_text='Mortality Rate (%)', row=1, col=2)
+    fig_trends.update_layout(
         template="plotly_white",
-        color_discrete_map=PROCEDURE_COLORS
+        hovermode="x unified",
+        legend=dict(groupclick='toggleitem')
     )
-    fig_volume_trend.update_layout(hovermode="x unified")
-    st.plotly_chart(fig_volume_trend, use_container_width=True)
+    st.plotly_chart(fig_trends, use_container_width=True)
 
-with col_trend2:
-    st.subheader("Mortality Rate Trends")
-    df_mortality_trend = df_filtered.groupby('Start_Year').agg(
-        Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
-        Expected_Mortality_Rate=('Expected_Mortality_Rate', 'mean'),
-        Risk_Adjusted_Mortality_Rate=('Risk_Adjusted_Mortality_Rate', 'mean')
-    ).reset_index()
-
-    fig_mortality_trend = go.Figure()
-    fig_mortality_trend.add_trace(go.Scatter(
-        x=df_mortality_trend['Start_Year'], y=df_mortality_trend['Observed_Mortality_Rate'],
-        mode='lines+markers', name='Observed Mortality', line=dict(color=PRIMARY_COLOR)
-    ))
-    fig_mortality_trend.add_trace(go.Scatter(
-        x=df_mortality_trend['Start_Year'], y=df_mortality_trend['Expected_Mortality_Rate'],
-        mode='lines+markers', name='Expected Mortality', line=dict(color=NEUTRAL_DARK, dash='dash')
-    ))
-    fig_mortality_trend.add_trace(go.Scatter(
-        x=df_mortality_trend['Start_Year'], y=df_mortality_trend['Risk_Adjusted_Mortality_Rate'],
-        mode='lines+markers', name='Risk-Adjusted Mortality', line=dict(color=SECONDARY_ACCENT, dash='dot')
-    ))
-
-    fig_mortality_trend.update_layout(
-        title='Average Mortality Rates Over Time',
-        xaxis_title='Year',
-        yaxis_title='Mortality Rate (%)',
+    st.subheader("Observed vs. Expected Mortality Difference Trend")
+    df_diff_trend = aggs["diff_trend"]
+    fig_diff_trend = px.line(
+        df_diff_trend,
+        x='Start_Year',
+        y='Observed_vs_Expected_Difference',
+        title='Average Observed vs. Expected Mortality Difference Over Time',
+        labels={'Observed_vs_Expected_Difference': 'Difference (%)', 'Start_Year': 'Year'},
         template="plotly_white",
-        hovermode="x unified"
+        color_discrete_sequence=[PRIMARY_COLOR]
     )
-    st.plotly_chart(fig_mortality_trend, use_container_width=True)
-
-st.subheader("Observed vs. Expected Mortality Difference Trend")
-df_diff_trend = df_filtered.groupby('Start_Year')['Observed_vs_Expected_Difference'].mean().reset_index()
-fig_diff_trend = px.line(
-    df_diff_trend,
-    x='Start_Year',
-    y='Observed_vs_Expected_Difference',
-    title='Average Observed vs. Expected Mortality Difference Over Time',
-    labels={'Observed_vs_Expected_Difference': 'Difference (%)', 'Start_Year': 'Year'},
-    template="plotly_white",
-    color_discrete_sequence=[PRIMARY_COLOR]
-)
-fig_diff_trend.add_hline(y=0, line_dash="dot", line_color=NEUTRAL_DARK, annotation_text="Zero Difference")
-fig_diff_trend.update_layout(hovermode="x unified")
-st.plotly_chart(fig_diff_trend, use_container_width=True)
+    fig_diff_trend.add_hline(y=0, line_dash="dot", line_color=NEUTRAL_DARK, annotation_text="Zero Difference")
+    fig_diff_trend.update_layout(hovermode="x unified")
+    st.plotly_chart(fig_diff_trend, use_container_width=True)
+
+overall_trends_section(aggs)
 
 st.markdown("---")
 
 # --- Analysis Area 2: Procedure-Specific Analysis ---
-st.header("Procedure-Specific Analysis")
-
-col_proc1, col_proc2 = st.columns(2)
-
-with col_proc1:
-    st.subheader("Procedure Volume Breakdown")
-    df_proc_volume = df_filtered.groupby('Procedure')['Number_of_Cases'].sum().reset_index()
-    fig_proc_volume = px.bar(
-        df_proc_volume,
-        x='Procedure',
-        y='Number_of_Cases',
-        title='Total Cases by Procedure Type',
-        labels={'Number_of_Cases': 'Total Cases'},
-        template="plotly_white",
-        color='Procedure',
-        color_discrete_map=PROCEDURE_COLORS
-    )
-    fig_proc_volume.update_layout(xaxis={'categoryorder':'total descending'})
-    st.plotly_chart(fig_proc_volume, use_container_width=True)
-
-with col_proc2:
-    st.subheader("Procedure Mortality Comparison")
-    df_proc_mortality = df_filtered.groupby('Procedure').agg(
-        Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
-        Expected_Mortality_Rate=('Expected_Mortality_Rate', 'mean')
-    ).reset_index()
+@st.fragment
+def procedure_section(aggs):
+    st.header("Procedure-Specific Analysis")
+
+    col_proc1, col_proc2 = st.columns(2)
+
+    with col_proc1:
+        st.subheader("Procedure Volume Breakdown")
+        df_proc_volume = aggs["proc_volume"]
+        fig_proc_volume = px.bar(
+            df_proc_volume,
+            x='Procedure',
+            y='Number_of_Cases',
+            title='Total Cases by Procedure Type',
+            labels={'Number_of_Cases': 'Total Cases'},
+            template="plotly_white",
+            color='Procedure',
+            color_discrete_map=PROCEDURE_COLORS
+        )
+        fig_proc_volume.update_layout(xaxis={'categoryorder':'total descending'})
+        st.plotly_chart(fig_proc_volume, use_container_width=True)
+
+    with col_proc2:
+        st.subheader("Procedure Mortality Comparison")
+        df_proc_mortality = aggs["proc_mortality"]
+
+        fig_proc_mortality = go.Figure(data=[
+            go.Bar(name='Observed', x=df_proc_mortality['Procedure'].to_numpy(), y=df_proc_mortality['Observed_Mortality_Rate'].to_numpy(), marker_color=PRIMARY_COLOR),
+            go.Bar(name='Expected', x=df_proc_mortality['Procedure'].to_numpy(), y=df_proc_mortality['Expected_Mortality_Rate'].to_numpy(), marker_color=NEUTRAL_DARK)
+        ])
+        fig_proc_mortality.update_layout(
+            barmode='group',
+            title='Average Mortality Rates by Procedure Type',
+            xaxis_title='Procedure',
+            yaxis_title='Mortality Rate (%)',
+            template="plotly_white"
+        )
+        st.plotly_chart(fig_proc_mortality, use_container_width=True)
 
-    fig_proc_mortality = go.Figure(data=[
-        go.Bar(name='Observed', x=df_proc_mortality['Procedure'], y=df_proc_mortality['Observed_Mortality_Rate'], marker_color=PRIMARY_COLOR),
-        go.Bar(name='Expected', x=df_proc_mortality['Procedure'], y=df_proc_mortality['Expected_Mortality_Rate'], marker_color=NEUTRAL_DARK)
-    ])
-    fig_proc_mortality.update_layout(
-        barmode='group',
-        title='Average Mortality Rates by Procedure Type',
-        xaxis_title='Procedure',
-        yaxis_title='Mortality Rate (%)',
-        template="plotly_white"
-    )
-    st.plotly_chart(fig_proc_mortality, use_container_width=True)
+procedure_section(aggs)
 
 st.markdown("---")
 
 # --- Analysis Area 3: Regional Performance Comparison ---
-st.header("Regional Performance Comparison")
-
-col_region1, col_region2 = st.columns(2)
-
-with col_region1:
-    st.subheader("Regional Mortality Performance")
-    df_region_diff = df_filtered.groupby('Region')['Observed_vs_Expected_Difference'].mean().reset_index()
-    fig_region_diff = px.bar(
-        df_region_diff,
-        x='Observed_vs_Expected_Difference',
-        y='Region',
-        orientation='h',
-        color='Observed_vs_Expected_Difference',
-        color_continuous_scale=[ACCENT_POSITIVE, PRIMARY_COLOR, ACCENT_NEGATIVE], # Custom diverging scale
-        title='Average Observed vs. Expected Mortality Difference by Region',
-        labels={'Observed_vs_Expected_Difference': 'Difference (%)'},
-        template="plotly_white"
-    )
-    fig_region_diff.update_layout(yaxis={'categoryorder':'total ascending'})
-    fig_region_diff.add_vline(x=0, line_dash="dot", line_color=NEUTRAL_DARK)
-    st.plotly_chart(fig_region_diff, use_container_width=True)
-
-with col_region2:
-    st.subheader("Regional Comparison Results Breakdown")
-    df_region_comp = df_filtered.groupby(['Region', 'Comparison_Results_Category']).size().reset_index(name='Count')
-    df_region_comp['Percentage'] = df_region_comp.groupby('Region')['Count'].transform(lambda x: x / x.sum())
-
-    fig_region_comp = px.bar(
-        df_region_comp,
-        x='Region',
-        y='Percentage',
-        color='Comparison_Results_Category',
-        title='Proportion of Hospitals by Comparison Result and Region',
-        labels={'Percentage': 'Percentage of Hospitals'},
-        category_orders={"Comparison_Results_Category": ['Rate higher than Statewide Rate', 'Rate not different than Statewide Rate', 'Rate lower than Statewide Rate']},
-        color_discrete_map=COMP_COLORS,
-        template="plotly_white"
-    )
-    fig_region_comp.update_layout(yaxis_tickformat=".0%")
-    st.plotly_chart(fig_region_comp, use_container_width=True)
+@st.fragment
+def regional_section(aggs):
+    st.header("Regional Performance Comparison")
+
+    col_region1, col_region2 = st.columns(2)
+
+    with col_region1:
+        st.subheader("Regional Mortality Performance")
+        df_region_diff = aggs["region_diff"]
+        fig_region_diff = px.bar(
+            df_region_diff,
+            x='Observed_vs_Expected_Difference',
+            y='Region',
+            orientation='h',
+            color='Observed_vs_Expected_Difference',
+            color_continuous_scale=[ACCENT_POSITIVE, PRIMARY_COLOR, ACCENT_NEGATIVE], # Custom diverging scale
+            title='Average Observed vs. Expected Mortality Difference by Region',
+            labels={'Observed_vs_Expected_Difference': 'Difference (%)'},
+            template="plotly_white"
+        )
+        fig_region_diff.update_layout(yaxis={'categoryorder':'total ascending'})
+        fig_region_diff.add_vline(x=0, line_dash="dot", line_color=NEUTRAL_DARK)
+        st.plotly_chart(fig_region_diff, use_container_width=True)
+
+    with col_region2:
+        st.subheader("Regional Comparison Results Breakdown")
+        df_region_comp = aggs["region_comp"]
+
+        fig_region_comp = px.bar(
+            df_region_comp,
+            x='Region',
+            y='Percentage',
+            color='Comparison_Results_Category',
+            title='Proportion of Hospitals by Comparison Result and Region',
+            labels={'Percentage': 'Percentage of Hospitals'},
+            category_orders={"Comparison_Results_Category": ['Rate higher than Statewide Rate', 'Rate not different than Statewide Rate', 'Rate lower than Statewide Rate']},
+            color_discrete_map=COMP_COLORS,
+            template="plotly_white"
+        )
+        fig_region_comp.update_layout(yaxis_tickformat=".0%")
+        st.plotly_chart(fig_region_comp, use_container_width=True)
+
+regional_section(aggs)
 
 st.markdown("---")
 
 # --- Analysis Area 4: Hospital-Level Performance & Outliers ---
-st.header("Hospital-Level Performance & Outliers")
-
-col_hospital1, col_hospital2 = st.columns(2)
-
-with col_hospital1:
-    st.subheader("Hospital Mortality & Volume Scatter Plot")
-    fig_hospital_scatter = px.scatter(
-        df_filtered,
-        x='Number_of_Cases',
-        y='Observed_Mortality_Rate',
-        color='Comparison_Results_Category',
-        hover_name='Hospital_Name',
-        title='Observed Mortality Rate vs. Number of Cases by Hospital',
-        labels={'Number_of_Cases': 'Total Cases', 'Observed_Mortality_Rate': 'Observed Mortality Rate (%)'},
-        color_discrete_map=COMP_COLORS,
-        log_x=True,
-        template="plotly_white"
-    )
-    st.plotly_chart(fig_hospital_scatter, use_container_width=True)
-
-with col_hospital2:
-    st.subheader("Top/Bottom Hospitals by Mortality Difference")
-    df_hospital_diff = df_filtered.groupby('Hospital_Name')['Observed_vs_Expected_Difference'].mean().reset_index()
-    top_n = 10
-    bottom_n = 10
-    df_top_bottom = pd.concat([
-        df_hospital_diff.nsmallest(top_n, 'Observed_vs_Expected_Difference'),
-        df_hospital_diff.nlargest(bottom_n, 'Observed_vs_Expected_Difference')
-    ]).sort_values(by='Observed_vs_Expected_Difference', ascending=False)
-
-    fig_top_bottom = px.bar(
-        df_top_bottom,
-        x='Observed_vs_Expected_Difference',
-        y='Hospital_Name',
-        orientation='h',
-        color='Observed_vs_Expected_Difference',
-        color_continuous_scale=[ACCENT_POSITIVE, PRIMARY_COLOR, ACCENT_NEGATIVE], # Custom diverging scale
-        title=f'Top {top_n} Best & Worst Hospitals by Avg. Mortality Difference',
-        labels={'Observed_vs_Expected_Difference': 'Difference (%)'},
-        template="plotly_white"
-    )
-    fig_top_bottom.update_layout(yaxis={'categoryorder':'total ascending'})
-    fig_top_bottom.add_vline(x=0, line_dash="dot", line_color=NEUTRAL_DARK)
-    st.plotly_chart(fig_top_bottom, use_container_width=True)
+@st.fragment
+def hospital_section(aggs):
+    st.header("Hospital-Level Performance & Outliers")
+
+    col_hospital1, col_hospital2 = st.columns(2)
+
+    with col_hospital1:
+        st.subheader("Hospital Mortality & Volume Scatter Plot")
+        # Plain float32 arrays let Plotly ship the points as base64 typed arrays instead of JSON lists
+        df_points = aggs["hospital_points"]
+        scatter_cases = df_points['Number_of_Cases'].to_numpy(dtype='float32')
+        scatter_mortality = df_points['Observed_Mortality_Rate'].to_numpy(dtype='float32')
+        scatter_hospitals = df_points['Hospital_Name'].to_numpy()
+        scatter_codes = df_points['Comparison_Results_Category'].cat.codes.to_numpy()
+        fallback_colors = px.colors.qualitative.Plotly
+
+        scatter_categories = df_points['Comparison_Results_Category'].cat.categories
+        per_category_limit = SCATTER_POINT_LIMIT // max(len(np.unique(scatter_codes)), 1)
+        sample_rng = np.random.default_rng(0)
+        is_sampled = len(scatter_codes) > SCATTER_POINT_LIMIT
+
+        fig_hospital_scatter = go.Figure()
+        for code, category in enumerate(scatter_categories):
+            in_category = np.flatnonzero(scatter_codes == code)
+            if not len(in_category):
+                continue
+            if is_sampled and len(in_category) > per_category_limit:
+                in_category = np.sort(sample_rng.choice(in_category, per_category_limit, replace=False))
+            fig_hospital_scatter.add_trace(go.Scattergl(
+                x=scatter_cases[in_category], y=scatter_mortality[in_category],
+                mode='markers', name=category, hovertext=scatter_hospitals[in_category],
+                hovertemplate='<b>%{hovertext}</b><br>Total Cases=%{x}<br>Observed Mortality Rate (%)=%{y}<extra></extra>',
+                marker_color=COMP_COLORS.get(category, fallback_colors[code % len(fallback_colors)])
+            ))
+        fig_hospital_scatter.update_layout(
+            title='Observed Mortality Rate vs. Number of Cases by Hospital',
+            xaxis_title='Total Cases',
+            yaxis_title='Observed Mortality Rate (%)',
+            xaxis_type='log',
+            legend_title_text='Comparison_Results_Category',
+            template="plotly_white"
+        )
+        st.plotly_chart(fig_hospital_scatter, use_container_width=True)
+        if is_sampled:
+            st.caption(f"Showing a stratified sample of up to {SCATTER_POINT_LIMIT:,} of {len(scatter_codes):,} points.")
+
+    with col_hospital2:
+        st.subheader("Top/Bottom Hospitals by Mortality Difference")
+        df_hospital_diff = aggs["hospital_diff"]
+        top_n = 10
+        bottom_n = 10
+        # One partition around both cut points picks the best and worst hospitals without sorting the rest
+        diff_values = df_hospital_diff['Observed_vs_Expected_Difference'].to_numpy()
+        if len(diff_values) > top_n + bottom_n:
+            partitioned = np.argpartition(diff_values, [top_n - 1, len(diff_values) - bottom_n])
+            extremes = np.concatenate([partitioned[:top_n], partitioned[-bottom_n:]])
+        else:
+            extremes = np.arange(len(diff_values))
+        df_top_bottom = df_hospital_diff.iloc[extremes].sort_values(by='Observed_vs_Expected_Difference', ascending=False)
+
+        fig_top_bottom = px.bar(
+            df_top_bottom,
+            x='Observed_vs_Expected_Difference',
+            y='Hospital_Name',
+            orientation='h',
+            color='Observed_vs_Expected_Difference',
+            color_continuous_scale=[ACCENT_POSITIVE, PRIMARY_COLOR, ACCENT_NEGATIVE], # Custom diverging scale
+            title=f'Top {top_n} Best & Worst Hospitals by Avg. Mortality Difference',
+            labels={'Observed_vs_Expected_Difference': 'Difference (%)'},
+            template="plotly_white"
+        )
+        fig_top_bottom.update_layout(yaxis={'categoryorder':'total ascending'})
+        fig_top_bottom.add_vline(x=0, line_dash="dot", line_color=NEUTRAL_DARK)
+        st.plotly_chart(fig_top_bottom, use_container_width=True)
+
+hospital_section(aggs)
 
 st.markdown("---")
 
 # --- Analysis Area 5: Confidence Intervals (Error Bars) ---
-st.header("Confidence Intervals & Data Reliability")
-
-st.subheader("Mortality Rate with Confidence Intervals by Procedure")
-df_ci_proc = df_filtered.groupby('Procedure').agg(
-    Observed_Mortality_Rate=('Observed_Mortality_Rate', 'mean'),
-    Lower_Limit_of_Confidence_Interval=('Lower_Limit_of_Confidence_Interval', 'mean'),
-    Upper_Limit_of_Confidence_Interval=('Upper_Limit_of_Confidence_Interval', 'mean')
-).reset_index()
-
-df_ci_proc['error_lower'] = df_ci_proc['Observed_Mortality_Rate'] - df_ci_proc['Lower_Limit_of_Confidence_Interval']
-df_ci_proc['error_upper'] = df_ci_proc['Upper_Limit_of_Confidence_Interval'] - df_ci_proc['Observed_Mortality_Rate']
-
-fig_ci = go.Figure(data=[
-    go.Bar(
-        x=df_ci_proc['Procedure'],
-        y=df_ci_proc['Observed_Mortality_Rate'],
-        name='Observed Mortality',
-        marker_color=PRIMARY_COLOR,
-        error_y=dict(
-            type='data',
-            symmetric=False,
-            array=df_ci_proc['error_upper'],
-            arrayminus=df_ci_proc['error_lower'],
-            visible=True,
-            color=NEUTRAL_DARK
+@st.fragment
+def confidence_interval_section(aggs):
+    st.header("Confidence Intervals & Data Reliability")
+
+    st.subheader("Mortality Rate with Confidence Intervals by Procedure")
+    df_ci_proc = aggs["ci_proc"]
+
+    fig_ci = go.Figure(data=[
+        go.Bar(
+            x=df_ci_proc['Procedure'].to_numpy(),
+            y=df_ci_proc['Observed_Mortality_Rate'].to_numpy(),
+            name='Observed Mortality',
+            marker_color=PRIMARY_COLOR,
+            error_y=dict(
+                type='data',
+                symmetric=False,
+                array=df_ci_proc['error_upper'].to_numpy(),
+                arrayminus=df_ci_proc['error_lower'].to_numpy(),
+                visible=True,
+                color=NEUTRAL_DARK
+            )
         )
+    ])
+    fig_ci.update_layout(
+        title='Average Observed Mortality Rate with 95% Confidence Intervals by Procedure',
+        xaxis_title='Procedure',
+        yaxis_title='Mortality Rate (%)',
+        template="plotly_white"
     )
-])
-fig_ci.update_layout(
-    title='Average Observed Mortality Rate with 95% Confidence Intervals by Procedure',
-    xaxis_title='Procedure',
-    yaxis_title='Mortality Rate (%)',
-    template="plotly_white"
-)
-st.plotly_chart(fig_ci, use_container_width=True)
-
-st.subheader("Confidence Interval Width vs. Number of Cases (Hospital-Level)")
-df_ci_width_hospital = df_filtered.groupby('Hospital_Name').agg(
-    Avg_CI_Width=('CI_Width', 'mean'),
-    Total_Cases=('Number_of_Cases', 'sum')
-).reset_index()
-
-fig_ci_width = px.scatter(
-    df_ci_width_hospital,
-    x='Total_Cases',
-    y='Avg_CI_Width',
-    hover_name='Hospital_Name',
-    title='Average Confidence Interval Width vs. Total Cases by Hospital',
-    labels={'Total_Cases': 'Total Cases', 'Avg_CI_Width': 'Average Confidence Interval Width (%)'},
-    log_x=True,
-    template="plotly_white",
-    color_discrete_sequence=[PRIMARY_COLOR]
-)
-st.plotly_chart(fig_ci_width, use_container_width=True)
+    st.plotly_chart(fig_ci, use_container_width=True)
+
+    st.subheader("Confidence Interval Width vs. Number of Cases (Hospital-Level)")
+    df_ci_width_hospital = aggs["ci_width_hospital"]
+
+    fig_ci_width = px.scatter(
+        x=df_ci_width_hospital['Total_Cases'].to_numpy(dtype='float32'),
+        y=df_ci_width_hospital['Avg_CI_Width'].to_numpy(dtype='float32'),
+        hover_name=df_ci_width_hospital['Hospital_Name'].to_numpy(),
+        title='Average Confidence Interval Width vs. Total Cases by Hospital',
+        labels={'x': 'Total Cases', 'y': 'Average Confidence Interval Width (%)'},
+        log_x=True,
+        render_mode="webgl",
+        template="plotly_white",
+        color_discrete_sequence=[PRIMARY_COLOR]
+    )
+    st.plotly_chart(fig_ci_width, use_container_width=True)
+
+confidence_interval_section(aggs)
 
 st.markdown("---")
 st.info("Data source: Cardiac Surgery and Percutaneous Coronary Interventions by Hospital: Beginning 2008")